@@ -5,12 +5,15 @@ RoyalCrash Backend — FastAPI + WebSocket
 import asyncio
 import hashlib
 import hmac
-import json
+import math
 import os
 import random
 import time
-from typing import Dict, Set
+from collections import deque
+from itertools import islice
+from typing import Dict
 
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -18,6 +21,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# uvloop заметно быстрее стандартного event loop; на Windows его нет
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 app = FastAPI(title="RoyalCrash Backend")
 
 app.add_middleware(
@@ -38,40 +48,137 @@ class GameState:
         self.round_id = 0
         self.start_time = 0.0
         self.bets: Dict[int, dict] = {}       # user_id → {amount, auto_cashout, cashed_out}
-        self.history: list = []               # последние 20 раундов
-        self.connections: Set[WebSocket] = set()
+        self.history = deque(maxlen=20)       # последние 20 раундов
+        self.connections: Dict[WebSocket, asyncio.Queue] = {}  # ws → очередь исходящих кадров
+        # SoA-представление авто-кешаутов: параллельные массивы вместо обхода dict
+        self.auto_uids: list = []             # user_id на позиции i
+        self.auto_targets: list = []          # целевой множитель на позиции i
+        self.auto_done = bytearray()          # 1 = ставка уже выведена
+        self.auto_index: Dict[int, int] = {}  # user_id → позиция в массивах
+        self.pending_bets: list = []          # новые ставки, ждущие общей рассылки
 
 game = GameState()
 
+# ln(1.0024)/100: множитель растёт как e^(ms*ln(1.0024)/100), exp() дешевле pow()
+_LN_GROWTH_PER_MS = math.log(1.0024) / 100
+
 # ── ГЕНЕРАЦИЯ КРАШ-ТОЧКИ (честная) ──────────────────────────────────────────
 
-def generate_crash_point(seed: str) -> float:
+# Шаблон HMAC с уже «впитанным» ключом: .copy() дешевле, чем hmac.new() каждый раунд
+_HMAC_TMPL = hmac.new(b"royalcrash_secret_key", b"", hashlib.sha256)
+
+# Проверка val % 33 == 0 без деления: для нечётного d
+# n делится на d ⇔ (n * d⁻¹ mod 2³²) ≤ ⌊(2³²−1)/d⌋
+_INV33 = pow(33, -1, 1 << 32)
+_DIV33_MAX = ((1 << 32) - 1) // 33
+
+def generate_crash_point(seed: bytes) -> float:
     """Честный краш через HMAC-SHA256"""
-    h = hmac.new(b"royalcrash_secret_key", seed.encode(), hashlib.sha256).hexdigest()
-    val = int(h[:8], 16)
-    # Дом имеет 3% преимущество
-    if val % 33 == 0:
+    h = _HMAC_TMPL.copy()
+    h.update(seed)
+    val = int.from_bytes(h.digest()[:4], "big")
+    # Дом имеет 3% преимущество (val % 33 == 0, сведено к умножению)
+    if (val * _INV33) & 0xFFFFFFFF <= _DIV33_MAX:
         return 1.0
     result = (100 / (1 - (val / 0xFFFFFFFF))) / 100
     return round(min(result, 10000.0), 2)
 
+# Numba-скан авто-кешаутов: JIT-машкод вместо байткода при тысячах ставок.
+# Зависимость опциональная — без неё работает чистый Python-проход.
+try:
+    import numpy as np
+    from numba import njit
+
+    @njit(cache=True)
+    def _scan_auto_cashouts(targets, done, m):
+        hits = np.empty(targets.shape[0], np.int64)
+        n = 0
+        for i in range(targets.shape[0]):
+            if done[i] == 0 and m >= targets[i]:
+                done[i] = 1
+                hits[n] = i
+                n += 1
+        return hits[:n]
+except ImportError:
+    np = None
+    _scan_auto_cashouts = None
+
+def build_auto_cashout_arrays():
+    """Собрать SoA-массивы авто-кешаутов из принятых ставок (раз на раунд)"""
+    game.auto_uids = []
+    game.auto_targets = []
+    game.auto_index = {}
+    for uid, bet in game.bets.items():
+        if bet["auto_cashout"]:
+            game.auto_index[uid] = len(game.auto_uids)
+            game.auto_uids.append(uid)
+            # Цель в сотых долях (fixed-point): скан сравнивает только int
+            game.auto_targets.append(int(bet["auto_cashout"] * 100 + 0.5))
+    game.auto_done = bytearray(len(game.auto_uids))
+    if np is not None:
+        game.auto_targets = np.asarray(game.auto_targets, dtype=np.int64)
+        game.auto_done = np.zeros(len(game.auto_uids), dtype=np.uint8)
+
 # ── WEBSOCKET МЕНЕДЖЕР ───────────────────────────────────────────────────────
 
+SEND_TIMEOUT = 2.0    # секунд на отправку одного кадра одному клиенту
+SEND_QUEUE = 100      # кадров в очереди клиента; переполнение = кадр отброшен
+
 async def broadcast(message: dict):
     """Разослать сообщение всем подключённым клиентам"""
-    if not game.connections:
-        return
-    data = json.dumps(message)
-    dead = set()
-    for ws in game.connections.copy():
+    await broadcast_bytes(orjson.dumps(message))
+
+async def broadcast_bytes(data: bytes):
+    """Положить готовый кадр в очередь каждого клиента (сериализация — один раз)
+
+    Сами отправки выполняют per-client задачи _client_sender, так что
+    медленный клиент не тормозит ни игровой цикл, ни остальных.
+    """
+    for queue in list(game.connections.values()):
         try:
-            await ws.send_text(data)
-        except Exception:
-            dead.add(ws)
-    game.connections -= dead
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            pass  # клиент безнадёжно отстал — тик можно пропустить
+
+async def _client_sender(websocket: WebSocket, queue: asyncio.Queue):
+    """Выделенная задача-отправитель одного клиента"""
+    try:
+        while True:
+            data = await queue.get()
+            await asyncio.wait_for(websocket.send_bytes(data), timeout=SEND_TIMEOUT)
+    except Exception:
+        game.connections.pop(websocket, None)
 
 # ── ИГРОВОЙ ЦИКЛ ────────────────────────────────────────────────────────────
 
+def _mark_cashout(uid, m2):
+    """Отметить ставку выведенной и вернуть её запись для тик-сообщения"""
+    bet = game.bets[uid]
+    bet["cashed_out"] = True
+    bet["cashout_at"] = m2
+    return {"user_id": uid, "multiplier": m2, "username": bet.get("username", "?")}
+
+async def broadcast_tick(m2: float):
+    """Скан авто-кешаутов и рассылка тика одним проходом"""
+    cashouts = []
+    m_x100 = int(m2 * 100 + 0.5)  # множитель в сотых: int против int
+    targets = game.auto_targets
+    done = game.auto_done
+    if _scan_auto_cashouts is not None and len(targets):
+        for i in _scan_auto_cashouts(targets, done, m_x100):
+            cashouts.append(_mark_cashout(game.auto_uids[i], m2))
+    else:
+        # Авто-кешаут: линейный проход по плотным массивам вместо dict
+        for i in range(len(targets)):
+            if not done[i] and m_x100 >= targets[i]:
+                done[i] = 1
+                cashouts.append(_mark_cashout(game.auto_uids[i], m2))
+    await broadcast_bytes(orjson.dumps({
+        "type": "tick",
+        "multiplier": m2,
+        "cashouts": cashouts
+    }))
+
 async def game_loop():
     """Основной игровой цикл"""
     while True:
@@ -79,7 +186,10 @@ async def game_loop():
         game.phase = "betting"
         game.round_id += 1
         game.bets = {}
-        seed = f"{game.round_id}_{time.time()}_{random.random()}"
+        # Бинарный seed: без f-string и .encode() на каждый раунд
+        seed = (game.round_id.to_bytes(8, "big")
+                + time.time_ns().to_bytes(8, "big")
+                + random.getrandbits(64).to_bytes(8, "big"))
         game.crash_point = generate_crash_point(seed)
 
         await broadcast({
@@ -87,46 +197,49 @@ async def game_loop():
             "round_id": game.round_id,
             "duration": 7000
         })
-        await asyncio.sleep(7)
+
+        # Ставки копятся в pending_bets и рассылаются пачкой раз в 100 мс,
+        # а не отдельным broadcast на каждую
+        for _ in range(70):
+            await asyncio.sleep(0.1)
+            if game.pending_bets:
+                batch, game.pending_bets = game.pending_bets, []
+                await broadcast({"type": "bet_placed", "bets": batch})
+        if game.pending_bets:
+            batch, game.pending_bets = game.pending_bets, []
+            await broadcast({"type": "bet_placed", "bets": batch})
 
         # ── ФАЗА ИГРЫ ──
         game.phase = "running"
         game.multiplier = 1.0
-        game.start_time = time.time()
+        game.start_time = time.monotonic()  # монотонные часы: NTP-скачки не ломают кривую
+        build_auto_cashout_arrays()
 
         await broadcast({
             "type": "round_start",
             "round_id": game.round_id,
-            "bets": [
-                {"user_id": uid, "amount": b["amount"], "username": b.get("username", "?")}
-                for uid, b in game.bets.items()
-            ]
+            # Публичные dict собраны один раз при приёме ставки
+            "bets": [b["public"] for b in game.bets.values()]
         })
 
         # Растим множитель
-        tick = 0.1  # секунд между тиками
-        while game.multiplier < game.crash_point:
-            await asyncio.sleep(tick)
-            elapsed = time.time() - game.start_time
-            # Формула роста: e^(0.00006 * ms)
-            game.multiplier = round(pow(1.0024, elapsed * 10), 2)
-
-            if game.multiplier >= game.crash_point:
+        TICK_MS = 100  # миллисекунд между тиками
+        # Миллисекунда, на которой кривая достигает crash_point (с поправкой на
+        # округление множителя до 2 знаков) — дальше сравниваем только int
+        crash_ms = math.ceil(math.log(max(game.crash_point - 0.005, 1.0)) / _LN_GROWTH_PER_MS)
+        elapsed_ms = 0
+        while elapsed_ms < crash_ms:
+            await asyncio.sleep(TICK_MS / 1000)
+            elapsed_ms = int((time.monotonic() - game.start_time) * 1000)
+            # Формула роста: 1.0024^(ms/100) == e^(ms*ln(1.0024)/100)
+            # Храним без округления; до 2 знаков режем только на границе рассылки
+            game.multiplier = math.exp(elapsed_ms * _LN_GROWTH_PER_MS)
+
+            if elapsed_ms >= crash_ms:
                 break
 
-            # Авто-кешаут
-            cashouts = []
-            for uid, bet in game.bets.items():
-                if not bet["cashed_out"] and bet["auto_cashout"] and game.multiplier >= bet["auto_cashout"]:
-                    bet["cashed_out"] = True
-                    bet["cashout_at"] = game.multiplier
-                    cashouts.append({"user_id": uid, "multiplier": game.multiplier, "username": bet.get("username", "?")})
-
-            await broadcast({
-                "type": "tick",
-                "multiplier": game.multiplier,
-                "cashouts": cashouts
-            })
+            # Скан авто-кешаутов и рассылка тика — один слитый проход
+            await broadcast_tick(round(game.multiplier, 2))
 
         # ── КРАШ ──
         game.phase = "crashed"
@@ -144,45 +257,56 @@ async def game_loop():
                 "cashout_at": bet.get("cashout_at", None)
             })
 
-        # Добавляем в историю
-        game.history.insert(0, {
+        # Добавляем в историю (maxlen=20 сам вытесняет старые раунды)
+        game.history.appendleft({
             "round_id": game.round_id,
             "crash_point": game.crash_point,
             "timestamp": int(time.time())
         })
-        game.history = game.history[:20]
 
         await broadcast({
             "type": "crashed",
             "multiplier": game.crash_point,
             "round_id": game.round_id,
             "results": results,
-            "history": game.history[:7]
+            "history": list(islice(game.history, 7))
         })
 
         await asyncio.sleep(3)
 
 # ── WEBSOCKET ENDPOINT ───────────────────────────────────────────────────────
 
+# Тексты ошибок не меняются — сериализуем один раз при старте
+_ERR_BETTING_CLOSED = orjson.dumps({
+    "type": "error",
+    "message": "Ставки принимаются только до начала раунда"
+})
+_ERR_BAD_AMOUNT = orjson.dumps({
+    "type": "error",
+    "message": "Некорректная сумма ставки"
+})
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    game.connections.add(websocket)
+    queue = asyncio.Queue(maxsize=SEND_QUEUE)
+    game.connections[websocket] = queue
+    sender = asyncio.create_task(_client_sender(websocket, queue))
 
     # Отправляем текущее состояние
-    await websocket.send_text(json.dumps({
+    await websocket.send_bytes(orjson.dumps({
         "type": "state",
         "phase": game.phase,
-        "multiplier": game.multiplier,
+        "multiplier": round(game.multiplier, 2),
         "round_id": game.round_id,
-        "history": game.history[:7],
+        "history": list(islice(game.history, 7)),
         "players_online": len(game.connections)
     }))
 
     try:
         while True:
             data = await websocket.receive_text()
-            msg = json.loads(data)
+            msg = orjson.loads(data)
 
             if msg["type"] == "place_bet":
                 user_id = msg.get("user_id")
@@ -191,17 +315,11 @@ async def websocket_endpoint(websocket: WebSocket):
                 username = msg.get("username", "Игрок")
 
                 if game.phase != "betting":
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "Ставки принимаются только до начала раунда"
-                    }))
+                    await websocket.send_bytes(_ERR_BETTING_CLOSED)
                     continue
 
                 if amount <= 0:
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "Некорректная сумма ставки"
-                    }))
+                    await websocket.send_bytes(_ERR_BAD_AMOUNT)
                     continue
 
                 game.bets[user_id] = {
@@ -209,37 +327,42 @@ async def websocket_endpoint(websocket: WebSocket):
                     "auto_cashout": float(auto_cashout) if auto_cashout else None,
                     "cashed_out": False,
                     "cashout_at": None,
-                    "username": username
+                    "username": username,
+                    # Готовый публичный вид для round_start, чтобы не пересобирать его на рассылке
+                    "public": {"user_id": user_id, "amount": amount, "username": username}
                 }
 
-                await broadcast({
-                    "type": "bet_placed",
-                    "user_id": user_id,
-                    "username": username,
-                    "amount": amount
-                })
+                # Коалесценция: рассылку сделает игровой цикл общей пачкой
+                game.pending_bets.append(game.bets[user_id]["public"])
 
             elif msg["type"] == "cashout":
                 user_id = msg.get("user_id")
                 if game.phase == "running" and user_id in game.bets:
                     bet = game.bets[user_id]
                     if not bet["cashed_out"]:
+                        m2 = round(game.multiplier, 2)
                         bet["cashed_out"] = True
-                        bet["cashout_at"] = game.multiplier
-                        winnings = round(bet["amount"] * game.multiplier, 4)
+                        bet["cashout_at"] = m2
+                        # Ручной кешаут выключает и авто-кешаут в SoA-массивах
+                        if user_id in game.auto_index:
+                            game.auto_done[game.auto_index[user_id]] = 1
+                        winnings = round(bet["amount"] * m2, 4)
 
                         await broadcast({
                             "type": "cashout",
                             "user_id": user_id,
                             "username": bet.get("username", "?"),
-                            "multiplier": game.multiplier,
+                            "multiplier": m2,
                             "winnings": winnings
                         })
 
     except WebSocketDisconnect:
-        game.connections.discard(websocket)
+        pass
     except Exception:
-        game.connections.discard(websocket)
+        pass
+    finally:
+        sender.cancel()
+        game.connections.pop(websocket, None)
 
 # ── REST API ─────────────────────────────────────────────────────────────────
 
@@ -247,15 +370,15 @@ async def websocket_endpoint(websocket: WebSocket):
 async def get_state():
     return {
         "phase": game.phase,
-        "multiplier": game.multiplier,
+        "multiplier": round(game.multiplier, 2),
         "round_id": game.round_id,
         "players_online": len(game.connections),
-        "history": game.history[:7]
+        "history": list(islice(game.history, 7))
     }
 
 @app.get("/history")
 async def get_history():
-    return {"history": game.history}
+    return {"history": list(game.history)}
 
 @app.get("/health")
 async def health():
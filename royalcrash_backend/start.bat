@@ -6,4 +6,4 @@ echo Starting RoyalCrash Backend...
 echo WebSocket: ws://localhost:8080/ws
 echo API: http://localhost:8080
 echo.
-uvicorn main:app --host 0.0.0.0 --port 8080 --reload
+uvicorn main:app --host 0.0.0.0 --port 8080 --reload --ws websockets --ws-per-message-deflate true